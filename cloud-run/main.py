@@ -4,20 +4,52 @@ Handles HTTP requests and processes images using graph_telemetry_service
 """
 import os
 import json
-import base64
-import tempfile
+import hashlib
+import logging
+import threading
+import cv2
+import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import sys
 
+# SIMD base64 decoder (AVX2/SSSE3); fall back to stdlib if the wheel is unavailable
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# orjson for fast response encoding; fall back to Flask's jsonify if unavailable
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Add parent directory to path to import graph_telemetry_service
 sys.path.insert(0, '/app')
 try:
-    from services.graph_telemetry.graph_telemetry_service import GraphTelemetryService
+    from services.graph_telemetry.graph_telemetry_service import GraphTelemetryService, _get_extractor
 except ImportError as e:
     # Fallback: try direct import
     sys.path.insert(0, '/app/services/graph-telemetry')
-    from graph_telemetry_service import GraphTelemetryService
+    from graph_telemetry_service import GraphTelemetryService, _get_extractor
+
+# Logging (lazy %-formatting, level from LOG_LEVEL) instead of print on the request path.
+# An unknown LOG_LEVEL falls back to INFO rather than failing the container at import.
+LOG_LEVEL = logging.getLevelName(os.environ.get('LOG_LEVEL', 'INFO').upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.INFO
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format='[Cloud Run] %(levelname)s %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Upper bound on the length of a "data:<mime>;base64," prefix
+DATA_URL_PREFIX_MAX_LEN = 64
+
+# Deadline (seconds) for the warmup Gemini ping
+WARMUP_GEMINI_TIMEOUT_S = 5
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -26,7 +58,103 @@ CORS(app)  # Enable CORS for all routes
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
 service = GraphTelemetryService(GOOGLE_API_KEY)
 
-print(f"✅ Cloud Run service initialized (API key: {'set' if GOOGLE_API_KEY else 'not set'})")
+
+def _warmup_gemini_channel(extractor):
+    """
+    Open the Gemini channel with one trivial request; the answer is ignored.
+    Calls the model directly (no retry wrapper) with a short deadline.
+    """
+    try:
+        ok, jpg = cv2.imencode('.jpg', np.zeros((1, 1, 3), np.uint8))
+        extractor.model.generate_content(
+            [extractor.PROMPT_USER, {"mime_type": "image/jpeg", "data": jpg.tobytes()}],
+            request_options={'timeout': WARMUP_GEMINI_TIMEOUT_S}
+        )
+        logger.info('Gemini warmup complete')
+    except Exception as e:
+        logger.warning('Gemini warmup failed: %s', e)
+
+
+def _warmup():
+    """
+    Pay the cold-start costs at container start instead of on the first request:
+    OpenCV kernel dispatch, Gemini SDK/protobuf loading and the JSON parse path.
+    The Gemini ping runs in a daemon thread so it never blocks worker boot.
+    """
+    try:
+        cv2.cvtColor(np.zeros((4, 4, 3), np.uint8), cv2.COLOR_BGR2HSV)
+        extractor = _get_extractor(GOOGLE_API_KEY)
+        extractor._parse_gemini_response('{"X-axis": [], "Y-axisTopValue": "0"}')
+        if not extractor.use_mock and extractor.model is not None:
+            threading.Thread(target=_warmup_gemini_channel, args=(extractor,), daemon=True).start()
+        logger.info('Warmup complete')
+    except Exception as e:
+        logger.warning('Warmup failed: %s', e)
+
+
+_warmup()
+
+logger.info('✅ Cloud Run service initialized (API key: %s)', 'set' if GOOGLE_API_KEY else 'not set')
+
+
+def _json_response(payload):
+    """
+    JSON response helper used in place of jsonify.
+    Encodes with orjson when available (UTF-8 bytes straight to the response).
+    """
+    if orjson is None:
+        return jsonify(payload)
+    return app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS),
+        mimetype='application/json'
+    )
+
+
+def _get_request_data():
+    """
+    Return the request payload, handling both the Firebase Functions format
+    ({"data": {...}}) and the direct format. Returns None if the body is missing.
+    """
+    request_data = request.get_json()
+    if not request_data:
+        return None
+    if 'data' in request_data:
+        return request_data['data']
+    return request_data
+
+
+def _decode_image(image_data):
+    """
+    Decode a base64 (optionally data-URL prefixed) image into a BGR numpy array.
+    Returns (image, cache_key) where cache_key is the SHA-256 of the image bytes,
+    used by the service to reuse Gemini results for repeated uploads.
+    Raises ValueError if the payload is not a decodable image.
+    """
+    # Remove data URL prefix if present ("data:image/...;base64,").
+    # The prefix is short, so only scan the head of the payload.
+    if image_data.startswith('data:'):
+        comma = image_data.find(',', 0, DATA_URL_PREFIX_MAX_LEN)
+        if comma != -1:
+            image_data = image_data[comma + 1:]
+    
+    image_bytes = base64.b64decode(image_data, validate=False)
+    logger.info('Decoded image: %d bytes', len(image_bytes))
+    
+    # Decode straight from memory - no temp file round-trip
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Could not decode image bytes')
+    return image, hashlib.sha256(image_bytes).digest()
+
+
+def _format_day_result(result, target_day):
+    """Shape a process_day result into the response fields for one day."""
+    return {
+        'day': result.get('day', target_day),
+        'minutes': result.get('minutes', 0),
+        'found': result.get('found', False),
+        'metadata': result.get('metadata', {})
+    }
 
 
 @app.route('/', methods=['POST'])
@@ -50,78 +178,119 @@ def process_screenshot():
     """
     try:
         # Get request data
-        request_data = request.get_json()
+        data = _get_request_data()
         
-        if not request_data:
-            return jsonify({
+        if not data:
+            return _json_response({
                 'success': False,
                 'error': 'Missing request body'
             }), 400
         
-        # Handle both Firebase Functions format and direct format
-        if 'data' in request_data:
-            data = request_data['data']
-        else:
-            data = request_data
-        
         image_data = data.get('imageData')
         target_day = data.get('targetDay')
         
         if not image_data or not target_day:
-            return jsonify({
+            return _json_response({
                 'success': False,
                 'error': 'Missing required parameters: imageData and targetDay'
             }), 400
         
-        print(f'[Cloud Run] Processing screenshot for day: {target_day}')
+        logger.info('Processing screenshot for day: %s', target_day)
         
         # Decode base64 image
         try:
-            # Remove data URL prefix if present
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            
-            image_bytes = base64.b64decode(image_data)
-            print(f'[Cloud Run] Decoded image: {len(image_bytes)} bytes')
+            image, cache_key = _decode_image(image_data)
         except Exception as e:
-            print(f'[Cloud Run] Error decoding image: {str(e)}')
-            return jsonify({
+            logger.warning('Error decoding image: %s', e)
+            return _json_response({
                 'success': False,
                 'error': f'Invalid image data format: {str(e)}'
             }), 400
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpeg') as tmp_file:
-            tmp_file.write(image_bytes)
-            temp_path = tmp_file.name
+        # Process the image
+        result = service.process_day(image, target_day, cache_key=cache_key)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Result: %s', result)
+        
+        # Return result in expected format
+        return _json_response({
+            'success': True,
+            **_format_day_result(result, target_day)
+        })
+    
+    except Exception as e:
+        logger.exception('Error processing screenshot: %s', e)
+        return _json_response({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/batch', methods=['POST'])
+def process_screenshot_batch():
+    """
+    Process one screenshot for several days with a single extraction
+    (one grid/bar detection pass and one Gemini call).
+    
+    Expected JSON body (Firebase Functions or direct format):
+    {
+        "data": {
+            "imageData": "base64_encoded_image",
+            "targetDays": ["ראשון", "שני"]
+        }
+    }
+    
+    Response:
+    {
+        "success": true,
+        "days": {
+            "ראשון": {"day": "ראשון", "minutes": 203.1, "found": true, "metadata": {...}},
+            ...
+        }
+    }
+    """
+    try:
+        data = _get_request_data()
+        
+        if not data:
+            return _json_response({
+                'success': False,
+                'error': 'Missing request body'
+            }), 400
+        
+        image_data = data.get('imageData')
+        target_days = data.get('targetDays')
+        
+        if (not image_data or not target_days or not isinstance(target_days, list)
+                or not all(isinstance(d, str) for d in target_days)):
+            return _json_response({
+                'success': False,
+                'error': 'Missing required parameters: imageData and targetDays (list of strings)'
+            }), 400
+        
+        logger.info('Processing screenshot for days: %s', target_days)
         
         try:
-            # Process the image
-            print(f'[Cloud Run] Calling graph_telemetry_service.process_day...')
-            result = service.process_day(temp_path, target_day)
-            print(f'[Cloud Run] Result: {result}')
-            
-            # Return result in expected format
-            return jsonify({
-                'success': True,
-                'day': result.get('day', target_day),
-                'minutes': result.get('minutes', 0),
-                'found': result.get('found', False),
-                'metadata': result.get('metadata', {})
-            })
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_path)
-                print(f'[Cloud Run] Cleaned up temp file: {temp_path}')
-            except Exception as e:
-                print(f'[Cloud Run] Warning: Could not delete temp file: {str(e)}')
+            image, cache_key = _decode_image(image_data)
+        except Exception as e:
+            logger.warning('Error decoding image: %s', e)
+            return _json_response({
+                'success': False,
+                'error': f'Invalid image data format: {str(e)}'
+            }), 400
+        
+        results = service.process_day_multi(image, target_days, cache_key=cache_key)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Results: %s', results)
+        
+        return _json_response({
+            'success': True,
+            'days': {day: _format_day_result(result, day) for day, result in results.items()}
+        })
     
     except Exception as e:
-        print(f'[Cloud Run] Error processing screenshot: {str(e)}')
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        logger.exception('Error processing screenshot batch: %s', e)
+        return _json_response({
             'success': False,
             'error': str(e)
         }), 500
@@ -130,15 +299,16 @@ def process_screenshot():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return _json_response({
         'status': 'ok',
         'service': 'graph-telemetry-processor',
         'python_version': sys.version
     }), 200
 
 
+# Local development only - in the container the app is served by gunicorn (see Dockerfile)
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
-    print(f'Starting Cloud Run service on port {port}')
+    logger.info('Starting Cloud Run service on port %d', port)
     app.run(host='0.0.0.0', port=port, debug=False)
 
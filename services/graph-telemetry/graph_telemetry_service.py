@@ -5,7 +5,41 @@ import re
 import sys
 from typing import Dict, List, Optional, Any, Tuple
 import os
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# לוגים עם פירמוט עצל (%-formatting) במקום print; ב-CLI מוגדרים ל-stderr ברמת DEBUG
+logger = logging.getLogger(__name__)
+
+# orjson הוא מפענח JSON מהיר (C); נופלים ל-json הסטנדרטי אם אינו מותקן
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# מדיניות retry אחידה לקריאות Gemini (exponential backoff) - רק לשגיאות זמניות (רשת/עומס);
+# שגיאות קבועות (מפתח שגוי, ארגומנט לא תקין) נזרקות מיד. ללא tenacity/google-api-core - ללא retry
+try:
+    from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+    from google.api_core import exceptions as google_exceptions
+    _gemini_retry = retry(
+        retry=retry_if_exception_type((
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.ResourceExhausted,
+            google_exceptions.InternalServerError,
+        )),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.5, max=4),
+        reraise=True
+    )
+except ImportError:
+    def _gemini_retry(func):
+        return func
 
 # Mock Gemini output when API key is empty
 MOCK_GEMINI_OUTPUT = {
@@ -28,9 +62,46 @@ COLOR_ANDROID_DARK = (0, 255, 255)  # צהוב
 COLOR_ANDROID_LIGHT = (255, 100, 0)  # כחול-כתום
 COLOR_RECLAIMED = (255, 0, 255)  # מג'נטה
 
+# טווחי HSV לזיהוי העמודות (מוקצים פעם אחת ברמת המודול)
+_LOWER_IOS = np.array([85, 120, 120], dtype=np.uint8)
+_UPPER_IOS = np.array([105, 255, 255], dtype=np.uint8)
+_LOWER_ANDROID_DARK = np.array([100, 50, 100], dtype=np.uint8)
+_UPPER_ANDROID_DARK = np.array([140, 255, 255], dtype=np.uint8)
+_LOWER_ANDROID_LIGHT = np.array([90, 20, 20], dtype=np.uint8)
+_UPPER_ANDROID_LIGHT = np.array([170, 255, 255], dtype=np.uint8)
+
+# קרנלים מורפולוגיים קבועים
+_CLEAN_KERNEL_3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+_CLOSE_KERNEL_1x15 = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 15))
+_HORIZ_KERNEL_40x1 = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
+# קרנל אופקי רחב לחיבור מקטעי קווי רשת מרוסקים (Pass 4). MORPH_RECT מבטיח את המסלול
+# המופרד של OpenCV (זמן ריצה שאינו תלוי ברוחב הקרנל)
+_HORIZ_KERNEL_80x1 = cv2.getStructuringElement(cv2.MORPH_RECT, (80, 1))
+
+# תווים שאינם חלק ממספר (לניקוי ערך ציר ה-Y שחולץ)
+_NUM_RE = re.compile(r"[^\d\.]")
 
-def _draw_final_bars(image, bar_positions, detection_type, reclaimed_contours_bytes=None):
-    """פונקציית עזר לציור הברים על תמונת הפלט הסופית."""
+# Thread pool להרצה מקבילית של הגלאים (OpenCV משחרר את ה-GIL בקוד ה-C)
+_DETECTOR_POOL = ThreadPoolExecutor(max_workers=3, thread_name_prefix="bar-detector")
+
+# Thread pool להרצה מקבילית של אסטרטגיות זיהוי הרשת ב-find_graph_area
+_GRID_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="grid-strategy")
+
+# באפרי עבודה פר-תהליכון (מסכות הגלאים, פלט Canny) - נשמרים בין בקשות בתהליכוני ה-pool
+_thread_buffers = threading.local()
+# מספר גדלי באפר Canny שנשמרים לכל תהליכון (תמונה מלאה + מוקטנת)
+_EDGES_BUFFERS_PER_THREAD = 2
+
+
+def _draw_final_bars(image, bar_positions, detection_type, reclaimed_contour_ids=None, draw_debug=False):
+    """
+    פונקציית עזר לציור הברים על תמונת הפלט הסופית.
+    bar_positions צפויים להיות ממוינים לפי ציר X (לצורך מספור נכון).
+    אם draw_debug כבוי - לא מועתקת התמונה ולא מצויר דבר, ומוחזר None.
+    """
+    if not draw_debug:
+        return None
+    
     debug_img = image.copy()
     
     if detection_type == "iOS":
@@ -42,16 +113,13 @@ def _draw_final_bars(image, bar_positions, detection_type, reclaimed_contours_by
     else:
         color = (255, 255, 255)  # צבע ברירת מחדל
     
-    # מיון לפי ציר X לצורך מספור נכון
-    bar_positions.sort(key=lambda b: b['center_x'])
-    
     for i, item in enumerate(bar_positions):
         x, y, w, h = item['bbox']
         
         # בחירת צבע הציור: מג'נטה למשוקם, רגיל לאחרים
         draw_color = color
-        if reclaimed_contours_bytes and item.get('cnt') is not None:
-            if item['cnt'].tobytes() in reclaimed_contours_bytes:
+        if reclaimed_contour_ids and item.get('cnt') is not None:
+            if id(item['cnt']) in reclaimed_contour_ids:
                 draw_color = COLOR_RECLAIMED
         
         cv2.rectangle(debug_img, (x, y), (x + w, y + h), draw_color, 3)
@@ -74,8 +142,9 @@ def _process_contours_to_positions(final_contours, detection_type, reclaimed_con
     """ממיר רשימת קונטורים גולמיים לרשימת מילוני מיקום."""
     bar_positions = []
     
-    # יצירת מזהה ייחודי לקונטורים המשוקמים לצורך סימון
-    reclaimed_contours_bytes = set(d['cnt'].tobytes() for d in reclaimed_contours_data) if reclaimed_contours_data else set()
+    # יצירת מזהה ייחודי (id) לקונטורים המשוקמים לצורך סימון.
+    # הקונטורים נשמרים ב-bar_positions ('cnt') ולכן ה-id נשאר תקף עד הציור.
+    reclaimed_contour_ids = {id(d['cnt']) for d in reclaimed_contours_data} if reclaimed_contours_data else set()
     
     for contour in final_contours:
         x, y, w, h = cv2.boundingRect(contour)
@@ -92,16 +161,60 @@ def _process_contours_to_positions(final_contours, detection_type, reclaimed_con
         }
         bar_positions.append(item)
     
-    return bar_positions, reclaimed_contours_bytes
+    return bar_positions, reclaimed_contour_ids
+
+
+def _filter_frame_contour(contours, total_area):
+    """
+    מסיר את קונטור המסגרת/רקע (הקונטור הגדול ביותר, אם הוא מכסה מעל 80% מהתמונה).
+    השטחים מחושבים פעם אחת ומוחזרים יחד עם הקונטורים לשימוש חוזר.
+    """
+    areas = [cv2.contourArea(c) for c in contours]
+    if not areas:
+        return contours, areas
+    
+    max_idx = int(np.argmax(areas))
+    if (areas[max_idx] / total_area) > 0.8:
+        keep = [i for i in range(len(contours)) if i != max_idx]
+        return [contours[i] for i in keep], [areas[i] for i in keep]
+    return contours, areas
+
+
+def _mask_buffers(hsv, mask=None, scratch=None):
+    """
+    מחזיר זוג באפרים (mask, scratch) בגודל HxW מסוג uint8 לשימוש כ-dst
+    בפעולות inRange/morphologyEx. באפרים שסופקו מוחזרים כמו שהם; אחרת מוחזרים
+    באפרים פר-תהליכון שנשמרים בין בקשות (מוקצים מחדש רק כשהגודל משתנה).
+    כל תהליכון מריץ גלאי אחד בכל פעם, ולכן הגלאים המקבילים לא דורסים זה את זה.
+    """
+    shape = hsv.shape[:2]
+    buffers = getattr(_thread_buffers, 'masks', None)
+    if buffers is None or buffers[0].shape != shape:
+        buffers = (np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8))
+        _thread_buffers.masks = buffers
+    return (mask if mask is not None else buffers[0],
+            scratch if scratch is not None else buffers[1])
+
+
+def _json_loads(json_str):
+    """
+    מפענח JSON עם orjson כשהוא זמין. orjson קפדני יותר (למשל NaN/Infinity),
+    ולכן במקרה של כשלון מנסים שוב עם json הסטנדרטי.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(json_str)
 
 
 ## --- פונקציות זיהוי נפרדות ---
 
-def detect_ios_bars(image, hsv):
+def detect_ios_bars(image, hsv, mask=None):
     """שלב 1: זיהוי דפוסי iOS (סרגל כחול)."""
-    lower_ios = np.array([85, 120, 120])
-    upper_ios = np.array([105, 255, 255])
-    mask_ios = cv2.inRange(hsv, lower_ios, upper_ios)
+    mask_ios, _ = _mask_buffers(hsv, mask)
+    cv2.inRange(hsv, _LOWER_IOS, _UPPER_IOS, dst=mask_ios)
     contours_ios, _ = cv2.findContours(mask_ios, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     valid_ios = [c for c in contours_ios if cv2.contourArea(c) > 300]
@@ -112,185 +225,123 @@ def detect_ios_bars(image, hsv):
     return []
 
 
-def detect_android_dark_bars(image, hsv):
+def detect_android_dark_bars(image, hsv, mask=None, scratch=None):
     """שלב 2א: זיהוי דפוסי אנדרואיד (רקע כהה) עם לוגיקת שחזור."""
+    mask, scratch = _mask_buffers(hsv, mask, scratch)
     
     img_width = image.shape[1]
     total_area = image.shape[0] * img_width
     
     RANGES = {
-        "Dark": (np.array([100, 50, 100]), np.array([140, 255, 255])),
+        "Dark": (_LOWER_ANDROID_DARK, _UPPER_ANDROID_DARK),
     }
     
-    clean_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 15))
-    best_candidates = []
-    suspect_contours = []
+    BASELINE_TOLERANCE = 30
+    
+    filtered_contours = []
+    candidate_idx = suspect_idx = np.empty(0, dtype=np.intp)
     
     for _, (lower, upper) in RANGES.items():
-        mask = cv2.inRange(hsv, lower, upper)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, clean_kernel)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, close_kernel)
+        cv2.inRange(hsv, lower, upper, dst=mask)
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, _CLEAN_KERNEL_3, dst=scratch)
+        cv2.morphologyEx(scratch, cv2.MORPH_CLOSE, _CLOSE_KERNEL_1x15, dst=mask)
         
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         # 4. סינון המסגרת/רקע
-        max_area = max([cv2.contourArea(c) for c in contours], default=0)
-        max_area_contour_index = np.argmax([cv2.contourArea(c) for c in contours]) if contours else -1
+        filtered_contours, _ = _filter_frame_contour(contours, total_area)
         
-        filtered_contours = []
-        if max_area_contour_index != -1 and (max_area / total_area) > 0.8:
-            for i, cnt in enumerate(contours):
-                if i != max_area_contour_index:
-                    filtered_contours.append(cnt)
-        else:
-            filtered_contours = contours
+        # 5. סינון ראשוני (גודל ופרופורציה) - שמירת "חשודים" (וקטורי, NumPy)
+        rects = np.array([cv2.boundingRect(c) for c in filtered_contours], dtype=np.int32).reshape(-1, 4)
+        widths = rects[:, 2]
+        heights = rects[:, 3]
+        bottoms = rects[:, 1] + heights
         
-        # 5. סינון ראשוני (גודל ופרופורציה) - שמירת "חשודים"
-        candidates = []
-        suspect_contours = []
-        
-        for cnt in filtered_contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            area = cv2.contourArea(cnt)
-            
-            is_suspect = False
-            reason = None
-            
-            if h < 5 or w < 5 or w > img_width * 0.9:
-                reason = 'Size'
-                is_suspect = True
-            
-            elif w > h * 2.5:
-                reason = 'Ratio'
-                is_suspect = True
-            
-            item = {'cnt': cnt, 'bottom': y + h, 'width': w, 'bbox': (x, y, w, h), 'area': area, 'reason': reason}
-            
-            if is_suspect:
-                suspect_contours.append(item)
-            else:
-                candidates.append(item)
+        is_suspect = (
+            (heights < 5) | (widths < 5) | (widths > img_width * 0.9)  # Size
+            | (widths > heights * 2.5)  # Ratio
+        )
+        candidate_idx = np.flatnonzero(~is_suspect)
+        suspect_idx = np.flatnonzero(is_suspect)
         
-        if len(candidates) >= 3:
-            best_candidates = candidates
+        if len(candidate_idx) >= 3:
             break
     
-    if len(best_candidates) < 3:
+    if len(candidate_idx) < 3:
         return [], []  # כשלון באנדרואיד כהה
     
     # 4. קיבוץ וסינון לפי קו בסיס (Baseline) - מציאת קו הבסיס המרכזי
-    candidates = best_candidates
-    candidates.sort(key=lambda k: k['bottom'])
-    rows = []
-    current_row = [candidates[0]]
-    for i in range(1, len(candidates)):
-        if candidates[i]['bottom'] - current_row[-1]['bottom'] < 30:
-            current_row.append(candidates[i])
-        else:
-            rows.append(current_row)
-            current_row = [candidates[i]]
-    rows.append(current_row)
+    # מיון לפי התחתית ופיצול לשורות היכן שהפער בין תחתיות עוקבות >= BASELINE_TOLERANCE
+    order = candidate_idx[np.argsort(bottoms[candidate_idx], kind='stable')]
+    row_breaks = np.flatnonzero(np.diff(bottoms[order]) >= BASELINE_TOLERANCE) + 1
+    rows = np.split(order, row_breaks)
     
-    best_row = max(rows, key=lambda r: sum(c['width'] for c in r), default=[])
-    
-    if not best_row:
-        return [], []
+    best_row = rows[int(np.argmax([widths[row].sum() for row in rows]))]
     
     # 5. בדיקת אחידות רוחב (Uniform Width Check) וסינון סופי
-    widths = [c['width'] for c in best_row]
-    median_width = np.median(widths)
-    baseline_y = np.median([c['bottom'] for c in best_row])
+    median_width = np.median(widths[best_row])
+    baseline_y = np.median(bottoms[best_row])
+    WIDTH_TOLERANCE = max(12, median_width * 0.50)
     
-    final_contours = []
-    
-    for item in best_row:
-        w = item['width']
-        tolerance = max(12, median_width * 0.50)
-        
-        if abs(w - median_width) <= tolerance:
-            final_contours.append(item['cnt'])
+    kept_idx = best_row[np.abs(widths[best_row] - median_width) <= WIDTH_TOLERANCE]
     
     # ==========================================
     # שלב 6: שחזור החשודים (Suspect Reclaiming)
     # ==========================================
-    reclaimed_contours_data = []
-    WIDTH_TOLERANCE = max(12, median_width * 0.50)
-    BASELINE_TOLERANCE = 30
+    reclaim_mask = (
+        (np.abs(widths[suspect_idx] - median_width) <= WIDTH_TOLERANCE)
+        & (np.abs(bottoms[suspect_idx] - baseline_y) <= BASELINE_TOLERANCE)
+    )
+    reclaimed_idx = suspect_idx[reclaim_mask]
     
-    for item in suspect_contours:
-        w = item['width']
-        
-        is_width_ok = abs(w - median_width) <= WIDTH_TOLERANCE
-        is_baseline_ok = abs(item['bottom'] - baseline_y) <= BASELINE_TOLERANCE
-        
-        if is_width_ok and is_baseline_ok:
-            reclaimed_contours_data.append(item)
-            final_contours.append(item['cnt'])
+    reclaimed_contours_data = [{'cnt': filtered_contours[i]} for i in reclaimed_idx]
+    final_contours = [filtered_contours[i] for i in kept_idx]
+    final_contours.extend(d['cnt'] for d in reclaimed_contours_data)
     
     # הכנה לפלט סופי - מיקום הבר
-    bar_positions, reclaimed_contours_bytes = _process_contours_to_positions(final_contours, "Android", reclaimed_contours_data)
+    bar_positions, reclaimed_contour_ids = _process_contours_to_positions(final_contours, "Android", reclaimed_contours_data)
     
-    return bar_positions, reclaimed_contours_bytes
+    return bar_positions, reclaimed_contour_ids
 
 
-def detect_android_light_bars(image, hsv):
+def detect_android_light_bars(image, hsv, mask=None, scratch=None):
     """שלב 2ב: זיהוי קשתות/כיפות לאנדרואיד עם רקע בהיר."""
+    mask, scratch = _mask_buffers(hsv, mask, scratch)
     img_height = image.shape[0]
     img_width = image.shape[1]
     total_area = img_height * img_width
-    clean_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
-    
-    # טווח צבע לרקע בהיר (טווח Light Mode)
-    lower_light = np.array([90, 20, 20])
-    upper_light = np.array([170, 255, 255])
     
-    # 1. יצירת מסכה
-    mask = cv2.inRange(hsv, lower_light, upper_light)
+    # 1. יצירת מסכה (טווח צבע לרקע בהיר - Light Mode)
+    cv2.inRange(hsv, _LOWER_ANDROID_LIGHT, _UPPER_ANDROID_LIGHT, dst=mask)
     
-    # 2. הסרת קווים אופקיים
-    horizontal_lines = cv2.morphologyEx(mask, cv2.MORPH_OPEN, horizontal_kernel)
-    mask = cv2.subtract(mask, horizontal_lines)
+    # 2. הסרת קווים אופקיים (הקווים נכתבים ל-scratch)
+    cv2.morphologyEx(mask, cv2.MORPH_OPEN, _HORIZ_KERNEL_40x1, dst=scratch)
+    cv2.subtract(mask, scratch, dst=mask)
     
     # 3. טיפול מורפולוגי - ניקוי רעש
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, clean_kernel)
+    cv2.morphologyEx(mask, cv2.MORPH_OPEN, _CLEAN_KERNEL_3, dst=scratch)
     
     # 4. מציאת קונטורים
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours, _ = cv2.findContours(scratch, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     # 5. סינון מסגרת/רקע
-    max_area = max([cv2.contourArea(c) for c in contours], default=0)
-    max_area_contour_index = np.argmax([cv2.contourArea(c) for c in contours]) if contours else -1
-    filtered_contours = []
-    
-    if max_area_contour_index != -1 and (max_area / total_area) > 0.8:
-        for i, cnt in enumerate(contours):
-            if i != max_area_contour_index:
-                filtered_contours.append(cnt)
-    else:
-        filtered_contours = contours
+    filtered_contours, filtered_areas = _filter_frame_contour(contours, total_area)
     
     # 6. ניתוח קונטורים וסינון קשתות
     dome_candidates = []
     
-    for cnt in filtered_contours:
+    for cnt, area in zip(filtered_contours, filtered_areas):
         x, y, w, h = cv2.boundingRect(cnt)
-        area = cv2.contourArea(cnt)
-        aspect_ratio = w / h if h > 0 else 0
-        perimeter = cv2.arcLength(cnt, True)
-        relative_y = y / img_height
         
-        # תנאים לזיהוי קשת:
-        if area < 100:
+        # תנאים לזיהוי קשת (הבדיקות הזולות על ה-bbox קודם):
+        if h < 5 or w < 10 or w > img_width * 0.3:
             continue
+        aspect_ratio = w / h
         if aspect_ratio < 2.0 or aspect_ratio > 10.0:
             continue
-        if h < 5:
+        if y / img_height > 0.90:
             continue
-        if relative_y > 0.90:
-            continue
-        if w < 10 or w > img_width * 0.3:
+        if area < 100:
             continue
         
         dome_candidates.append({
@@ -320,47 +371,88 @@ def detect_android_light_bars(image, hsv):
     return []
 
 
+## --- בחירת גלאי ---
+
+# סדר העדיפות בין הגלאים ושם סוג הזיהוי של כל אחד
+_DETECTION_PRIORITY = ("ios", "android_dark", "android_light")
+_DETECTION_TYPES = {"ios": "iOS", "android_dark": "Android", "android_light": "Android-Light"}
+
+# פרמטרים לבדיקת הפלטפורמה המהירה
+_PROBE_SIZE = (64, 64)
+_PROBE_IOS_MIN_FRACTION = 0.003  # שיעור פיקסלים מינימלי בצבע iOS בתמונה הממוזערת
+_PROBE_DARK_MAX_LUMA = 100  # בהירות ממוצעת מתחתיה הרקע נחשב כהה
+
+
+def _quick_platform_probe(image):
+    """
+    מנחש את הפלטפורמה מתוך תמונה ממוזערת (64x64) במרחב BGR, ללא המרת HSV:
+    "ios" אם יש מספיק פיקסלים בטווח הכחול של iOS, אחרת "android_dark" /
+    "android_light" לפי הבהירות הממוצעת.
+    """
+    thumb = cv2.resize(image, _PROBE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int32)
+    b, g, r = thumb[..., 0], thumb[..., 1], thumb[..., 2]
+    
+    # המקבילה ב-BGR ל-_LOWER_IOS/_UPPER_IOS: כחול דומיננטי (V>=120, S>=~0.47),
+    # וגוון בין תכלת לכחול (G-R לפחות חצי מ-B-R)
+    chroma = b - r
+    ios_like = (b >= 120) & (b >= g) & (chroma * 255 >= 120 * b) & (2 * (g - r) >= chroma)
+    if ios_like.mean() >= _PROBE_IOS_MIN_FRACTION:
+        return "ios"
+    
+    luma = 0.114 * b + 0.587 * g + 0.299 * r
+    return "android_dark" if luma.mean() < _PROBE_DARK_MAX_LUMA else "android_light"
+
+
+def _run_detector(platform, image, hsv):
+    """מריץ את הגלאי של הפלטפורמה ומחזיר (bar_positions, reclaimed_contour_ids)."""
+    if platform == "ios":
+        return detect_ios_bars(image, hsv), None
+    if platform == "android_dark":
+        return detect_android_dark_bars(image, hsv)
+    return detect_android_light_bars(image, hsv), None
+
+
 ## --- פונקציה ראשית ---
 
-def detect_bars_positions(image):
+def detect_bars_positions(image, draw_debug: bool = False):
     """
     מזהה את מיקומי העמודות בתמונה על ידי ניסיון לזהות דפוסי iOS,
     דפוסי אנדרואיד כהה (עם שחזור) או דפוסי אנדרואיד בהיר.
-    הפלט מכיל רשימת מיקומי עמודות ותמונה ויזואלית של הברים שזוהו.
+    הפלט מכיל רשימת מיקומי עמודות ותמונה ויזואלית של הברים שזוהו
+    (רק כאשר draw_debug=True; אחרת התמונה היא None).
     """
-    
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
     
-    # 1. ניסיון זיהוי iOS
-    bar_positions_ios = detect_ios_bars(image, hsv)
+    # 1. בדיקה מהירה על תמונה ממוזערת - מריצים קודם רק את הגלאי המתאים לפלטפורמה המשוערת
+    probed_platform = _quick_platform_probe(image)
+    results = {probed_platform: _run_detector(probed_platform, image, hsv)}
     
-    if bar_positions_ios:
-        final_positions = bar_positions_ios
-        detection_type = "iOS"
-        reclaimed_contours_bytes = None
-    else:
-        # 2. ניסיון זיהוי אנדרואיד כהה
-        bar_positions_android_dark, reclaimed_contours_bytes = detect_android_dark_bars(image, hsv)
-        
-        if len(bar_positions_android_dark) >= 3:
-            final_positions = bar_positions_android_dark
-            detection_type = "Android"
-        else:
-            # 3. ניסיון זיהוי אנדרואיד בהיר (Light Mode)
-            bar_positions_android_light = detect_android_light_bars(image, hsv)
-            
-            if bar_positions_android_light:
-                final_positions = bar_positions_android_light
-                detection_type = "Android-Light"
-                reclaimed_contours_bytes = None
-            else:
-                # כשלון סופי בזיהוי
-                final_positions = []
-                detection_type = "None"
-                reclaimed_contours_bytes = None
-    
-    # יצירת תמונת הפלט הסופית עם הציורים
-    final_debug_image = _draw_final_bars(image, final_positions, detection_type, reclaimed_contours_bytes)
+    # 2. אם הגלאי המשוער נכשל - הרצת שאר הגלאים במקביל על אותו hsv (קריאה בלבד).
+    # כל גלאי משתמש בבאפרי המסכה של התהליכון שלו, כדי שהתהליכונים לא ידרסו זה את זה.
+    if len(results[probed_platform][0]) < 3:
+        futures = {
+            platform: _DETECTOR_POOL.submit(_run_detector, platform, image, hsv)
+            for platform in _DETECTION_PRIORITY if platform != probed_platform
+        }
+        results.update({platform: future.result() for platform, future in futures.items()})
+    
+    # 3. בחירה לפי עדיפות: iOS > אנדרואיד כהה > אנדרואיד בהיר (3+ עמודות)
+    final_positions = []
+    detection_type = "None"  # כשלון סופי בזיהוי
+    reclaimed_contour_ids = None
+    for platform in _DETECTION_PRIORITY:
+        positions, reclaimed_ids = results.get(platform, ([], None))
+        if len(positions) >= 3:
+            final_positions = positions
+            detection_type = _DETECTION_TYPES[platform]
+            reclaimed_contour_ids = reclaimed_ids
+            break
+    
+    # מיון לפי ציר X לצורך מספור נכון
+    final_positions.sort(key=lambda b: b['center_x'])
+    
+    # יצירת תמונת הפלט הסופית עם הציורים (רק לפי בקשה)
+    final_debug_image = _draw_final_bars(image, final_positions, detection_type, reclaimed_contour_ids, draw_debug)
     
     # הסרת הקונטור הגולמי (cnt) מהמילון לפני ההחזרה
     cleaned_final_positions = []
@@ -376,6 +468,52 @@ def detect_bars_positions(image):
 # ==================================
 
 class SinglePromptGraphExtractor:
+    # הוראות קבועות - נשלחות כ-system_instruction פעם אחת בבניית המודל
+    PROMPT_SYSTEM = (
+        "You are an expert graph analyzer. Analyze the *entire* graph image.\n"
+        "You have two tasks:\n"
+        "1.  **X-Axis**: Identify ALL day-of-the-week labels (e.g., 'Sun', 'Mon', 'א', 'ב').\n"
+        "    - **Format**: For EACH label found, map it to its full **Hebrew day name** (e.g., 'Sun' -> 'ראשון', 'Mon' -> 'שני', 'א' -> 'ראשון').\n"
+        "    - **Order**: List these labels in the JSON array in strict visual order from **RIGHT-TO-LEFT** (starting with the rightmost label).\n"
+        "    - **Status**: For EACH label, state if a colored bar is above it ('true') or if the space is empty ('false').\n"
+        "\n"
+        "2.  **Y-Axis**: Identify the *highest* numerical label shown on the Y-axis. This value represents a quantity of **minutes**. Extract *only* the numerical value you see (e.g., '120', '1.5k', '80').\n"
+        "\n"
+        "You MUST return *only* a single, valid JSON object in this exact format:\n"
+        "{\n"
+        "  \"X-axis\": [\n"
+        "    {\"label\": \"שם_יום_עברי\", \"has_bar\": true/false}, \n"
+        "    ... \n"
+        "  ],\n"
+        "  \"Y-axisTopValue\": \"TopValue\"\n"
+        "}\n"
+        "\n"
+        "Example 1: Graph visually shows 'א(yes), ב(no)' from right-to-left.\n"
+        "{\n"
+        "  \"X-axis\": [\n"
+        "    {\"label\": \"ראשון\", \"has_bar\": true},\n"
+        "    {\"label\": \"שני\", \"has_bar\": false}\n"
+        "  ],\n"
+        "  \"Y-axisTopValue\": \"120\"\n"
+        "}\n"
+        "\n"
+        "Example 2: Graph visually shows 'Sun(yes), Mon(no)' from left-to-right. Your output *must* be right-to-left.\n"
+        "{\n"
+        "  \"X-axis\": [\n"
+        "    {\"label\": \"שני\", \"has_bar\": false},\n"
+        "    {\"label\": \"ראשון\", \"has_bar\": true}\n"
+        "  ],\n"
+        "  \"Y-axisTopValue\": \"100\"\n"
+        "}\n"
+        "Do not add any text before or after the JSON object."
+    )
+    
+    # הודעת המשתמש הקצרה שנשלחת יחד עם התמונה בכל קריאה
+    PROMPT_USER = "Analyze."
+    
+    # איכות JPEG לתמונה הנשלחת ל-Gemini
+    JPEG_QUALITY = 85
+    
     def __init__(self, google_api_key: str = None):
         self.model = None
         self.google_api_key = google_api_key
@@ -384,49 +522,61 @@ class SinglePromptGraphExtractor:
         if not self.use_mock:
             try:
                 import google.generativeai as genai
-                genai.configure(api_key=google_api_key)
-                self.model = genai.GenerativeModel('gemini-flash-latest')
-                print("✅ Gemini API מוגדר ומוכן.", file=sys.stderr)
+                # gRPC transport מפורש - הערוץ נשמר בין בקשות דרך ה-service ברמת המודול
+                genai.configure(api_key=google_api_key, transport='grpc')
+                self.model = genai.GenerativeModel(
+                    'gemini-flash-latest',
+                    system_instruction=self.PROMPT_SYSTEM,
+                    generation_config={"response_mime_type": "application/json"}
+                )
+                logger.debug("✅ Gemini API מוגדר ומוכן.")
             except Exception as e:
-                print(f"🔥🔥🔥 שגיאה קריטית ב-INIT: לא ניתן להגדיר את Gemini API. {e}", file=sys.stderr)
+                logger.error("🔥🔥🔥 שגיאה קריטית ב-INIT: לא ניתן להגדיר את Gemini API. %s", e)
                 self.use_mock = True
         else:
-            print("Using mock Gemini output (API key is empty)", file=sys.stderr)
-        
-        # Compilation of Regex for speed
-        self.json_pattern = re.compile(r"\{.*\}", re.DOTALL)
+            logger.info("Using mock Gemini output (API key is empty)")
     
     def _parse_gemini_response(self, text_response):
         """
         (חדש) מפענח את תגובת ה-JSON של המודל.
         הוא מחפש באופן יציב בלוק JSON גם אם יש טקסט מסביב.
         """
-        print(f"📝 Gemini (Raw): {text_response}", file=sys.stderr)
-        
-        # נסה למצוא את בלוק ה-JSON, גם אם הוא עטוף ב-```json ... ```
-        json_match = self.json_pattern.search(text_response)
-        
-        if not json_match:
-            print("🔥🔥🔥 שגיאת פענוח: לא נמצא בלוק JSON בתגובה.", file=sys.stderr)
-            return {"X-axis": [], "Y-axisTopValue": "JSON_PARSE_FAILED"}
-        
-        json_str = json_match.group(0)
+        logger.debug("📝 Gemini (Raw): %s", text_response)
         
+        # מסלול מהיר: התגובה היא אובייקט JSON נקי (response_mime_type=application/json)
         try:
-            # פענח את ה-JSON
-            parsed_data = json.loads(json_str)
-            
-            # ודא שהמפתחות הצפויים קיימים
-            if "X-axis" not in parsed_data:
-                parsed_data["X-axis"] = []
-            if "Y-axisTopValue" not in parsed_data:
-                parsed_data["Y-axisTopValue"] = "KEY_MISSING"
+            parsed_data = _json_loads(text_response)
+        except json.JSONDecodeError:
+            parsed_data = None
+        
+        if not isinstance(parsed_data, dict):
+            # נסה למצוא את בלוק ה-JSON, גם אם הוא עטוף ב-```json ... ```
+            start = text_response.find('{')
+            end = text_response.rfind('}')
             
-            return parsed_data
+            if start == -1 or end < start:
+                logger.warning("🔥🔥🔥 שגיאת פענוח: לא נמצא בלוק JSON בתגובה.")
+                return {"X-axis": [], "Y-axisTopValue": "JSON_PARSE_FAILED"}
             
-        except json.JSONDecodeError as e:
-            print(f"🔥🔥🔥 שגיאת פענוח: ה-JSON שהתקבל אינו תקין. {e}", file=sys.stderr)
-            return {"X-axis": [], "Y-axisTopValue": "JSON_DECODE_ERROR"}
+            try:
+                # פענח את ה-JSON
+                parsed_data = _json_loads(text_response[start:end + 1])
+            except json.JSONDecodeError as e:
+                logger.warning("🔥🔥🔥 שגיאת פענוח: ה-JSON שהתקבל אינו תקין. %s", e)
+                return {"X-axis": [], "Y-axisTopValue": "JSON_DECODE_ERROR"}
+        
+        # ודא שהמפתחות הצפויים קיימים
+        if "X-axis" not in parsed_data:
+            parsed_data["X-axis"] = []
+        if "Y-axisTopValue" not in parsed_data:
+            parsed_data["Y-axisTopValue"] = "KEY_MISSING"
+        
+        return parsed_data
+    
+    @_gemini_retry
+    def _generate_content(self, parts):
+        """קריאת generate_content עם retry ו-backoff על שגיאות רשת/זמניות."""
+        return self.model.generate_content(parts)
     
     def _call_gemini_single_prompt(self, full_image):
         """
@@ -434,62 +584,28 @@ class SinglePromptGraphExtractor:
         ומבקש פלט JSON.
         """
         if self.use_mock:
-            print("Returning mock Gemini output", file=sys.stderr)
+            logger.debug("Returning mock Gemini output")
             return {'text_response': json.dumps(MOCK_GEMINI_OUTPUT)}
         
         if not self.model:
-            print("🔥🔥🔥 קריאת API בוטלה: מודל Gemini לא אותחל.", file=sys.stderr)
+            logger.error("🔥🔥🔥 קריאת API בוטלה: מודל Gemini לא אותחל.")
             return {'text_response': '{"X-axis": [], "Y-axisTopValue": "MODEL_INIT_FAILED"}'}
         
-        print(f"🤖 שולח בקשה יחידה ל-Gemini API (כל התמונה)...", file=sys.stderr)
+        logger.debug("🤖 שולח בקשה יחידה ל-Gemini API (כל התמונה)...")
         try:
-            from PIL import Image
-            image_pil = Image.fromarray(cv2.cvtColor(full_image, cv2.COLOR_BGR2RGB))
-            
-            prompt = (
-                "You are an expert graph analyzer. Analyze the *entire* graph image.\n"
-                "You have two tasks:\n"
-                "1.  **X-Axis**: Identify ALL day-of-the-week labels (e.g., 'Sun', 'Mon', 'א', 'ב').\n"
-                "    - **Format**: For EACH label found, map it to its full **Hebrew day name** (e.g., 'Sun' -> 'ראשון', 'Mon' -> 'שני', 'א' -> 'ראשון').\n"
-                "    - **Order**: List these labels in the JSON array in strict visual order from **RIGHT-TO-LEFT** (starting with the rightmost label).\n"
-                "    - **Status**: For EACH label, state if a colored bar is above it ('true') or if the space is empty ('false').\n"
-                "\n"
-                "2.  **Y-Axis**: Identify the *highest* numerical label shown on the Y-axis. This value represents a quantity of **minutes**. Extract *only* the numerical value you see (e.g., '120', '1.5k', '80').\n"
-                "\n"
-                "You MUST return *only* a single, valid JSON object in this exact format:\n"
-                "{\n"
-                "  \"X-axis\": [\n"
-                "    {\"label\": \"שם_יום_עברי\", \"has_bar\": true/false}, \n"
-                "    ... \n"
-                "  ],\n"
-                "  \"Y-axisTopValue\": \"TopValue\"\n"
-                "}\n"
-                "\n"
-                "Example 1: Graph visually shows 'א(yes), ב(no)' from right-to-left.\n"
-                "{\n"
-                "  \"X-axis\": [\n"
-                "    {\"label\": \"ראשון\", \"has_bar\": true},\n"
-                "    {\"label\": \"שני\", \"has_bar\": false}\n"
-                "  ],\n"
-                "  \"Y-axisTopValue\": \"120\"\n"
-                "}\n"
-                "\n"
-                "Example 2: Graph visually shows 'Sun(yes), Mon(no)' from left-to-right. Your output *must* be right-to-left.\n"
-                "{\n"
-                "  \"X-axis\": [\n"
-                "    {\"label\": \"שני\", \"has_bar\": false},\n"
-                "    {\"label\": \"ראשון\", \"has_bar\": true}\n"
-                "  ],\n"
-                "  \"Y-axisTopValue\": \"100\"\n"
-                "}\n"
-                "Do not add any text before or after the JSON object."
-            )
+            # קידוד JPEG יחיד ישירות מ-BGR (במקום המרה ל-RGB + PIL וקידוד מחדש ב-SDK)
+            ok, jpg = cv2.imencode('.jpg', full_image, [cv2.IMWRITE_JPEG_QUALITY, self.JPEG_QUALITY])
+            if not ok:
+                raise ValueError("cv2.imencode failed to encode the image as JPEG")
             
-            response = self.model.generate_content([prompt, image_pil])
+            response = self._generate_content([
+                self.PROMPT_USER,
+                {"mime_type": "image/jpeg", "data": jpg.tobytes()}
+            ])
             return {'text_response': response.text}
             
         except Exception as e:
-            print(f"🔥🔥🔥 שגיאה קריטית בקריאה ל-Gemini API: {e}", file=sys.stderr)
+            logger.error("🔥🔥🔥 שגיאה קריטית בקריאה ל-Gemini API: %s", e)
             return {'text_response': '{"X-axis": [], "Y-axisTopValue": "API_CALL_FAILED"}'}
     
     def extract_graph_data(self, image):
@@ -504,7 +620,7 @@ class SinglePromptGraphExtractor:
             return MOCK_GEMINI_OUTPUT
         
         if not self.model:
-            print("🔥🔥🔥 בוטל: מודל Gemini לא אותחל כראוי (בדוק API key).", file=sys.stderr)
+            logger.error("🔥🔥🔥 בוטל: מודל Gemini לא אותחל כראוי (בדוק API key).")
             return {"X-axis": [], "Y-axisTopValue": "MODEL_INIT_FAILED"}
         
         # --- Process 1: Single API Call ---
@@ -513,10 +629,16 @@ class SinglePromptGraphExtractor:
         # --- Process 2: Parse Response ---
         final_output = self._parse_gemini_response(gemini_response['text_response'])
         
-        print("✅ חילוץ נתונים הושלם.", file=sys.stderr)
+        logger.debug("✅ חילוץ נתונים הושלם.")
         return final_output
 
 
+@lru_cache(maxsize=4)
+def _get_extractor(google_api_key: str = "") -> SinglePromptGraphExtractor:
+    """ מחזיר SinglePromptGraphExtractor משותף לכל מפתח API (המודל נבנה פעם אחת לכל מפתח) """
+    return SinglePromptGraphExtractor(google_api_key)
+
+
 # ==================================
 # Main processing function (UPDATED)
 # ==================================
@@ -526,54 +648,72 @@ def extract_graph_labels(image, google_api_key: str = None):
     פונקציה ראשית חדשה המשתמשת ב-SinglePromptGraphExtractor
     כדי לחלץ את כל הנתונים בקריאה אחת.
     """
-    detector = SinglePromptGraphExtractor(google_api_key)
+    detector = _get_extractor(google_api_key or "")
     # קבל את הפלט הסופי
     final_output = detector.extract_graph_data(image)
     
     # הדפס את הפלט הסופי בפורמט JSON יפה
-    print("\n✅ Final Extracted Data (JSON Output):", file=sys.stderr)
-    print(json.dumps(final_output, indent=2, ensure_ascii=False), file=sys.stderr)
+    # הדפסת ה-JSON (יקרה) רק כשרמת DEBUG פעילה
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("✅ Final Extracted Data (JSON Output):\n%s", json.dumps(final_output, indent=2, ensure_ascii=False))
     
     if not final_output.get("X-axis") and "FAILED" in final_output.get("Y-axisTopValue", "FAILED"):
-        print("\n❌ Could not extract any data from the graph.", file=sys.stderr)
+        logger.warning("❌ Could not extract any data from the graph.")
     
     return final_output
 
 
 def _load_image(path: str) -> Optional[np.ndarray]:
-    """ טוען תמונה, עם fallback ל-PIL עבור פורמטים בעייתיים """
-    img = cv2.imread(path)
+    """
+    טוען תמונה (np.fromfile + cv2.imdecode - תומך גם בנתיבי Unicode),
+    עם fallback ל-PIL עבור פורמטים בעייתיים
+    """
+    try:
+        data = np.fromfile(path, dtype=np.uint8)
+    except OSError as e:
+        logger.warning("Error loading image: %s", e)
+        return None
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
     if img is None:
         try:
             from PIL import Image
             pil_img = Image.open(path).convert('RGB')
             img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
         except Exception as e:
-            print(f"Error loading image: {e}", file=sys.stderr)
+            logger.warning("Error loading image: %s", e)
             return None
     return img
 
 
-def _cluster_lines(lines: List[np.ndarray], orientation: str = 'horizontal') -> List[int]:
-    """ מקבץ מקטעי קווים לקווים בודדים על ידי מיצוע """
-    if not lines:
+def _edges_buffer(shape: Tuple[int, int]) -> np.ndarray:
+    """
+    מחזיר באפר uint8 פר-תהליכון בגודל shape לפלט cv2.Canny.
+    הבאפרים נשמרים לפי גודל (מעברים מוקטנים ומלאים רצים על אותם תהליכונים),
+    ומוגבלים לשני גדלים אחרונים לכל תהליכון.
+    """
+    buffers = getattr(_thread_buffers, 'edges', None)
+    if buffers is None:
+        buffers = _thread_buffers.edges = OrderedDict()
+    buf = buffers.get(shape)
+    if buf is None:
+        buf = buffers[shape] = np.empty(shape, dtype=np.uint8)
+        while len(buffers) > _EDGES_BUFFERS_PER_THREAD:
+            buffers.popitem(last=False)
+    else:
+        buffers.move_to_end(shape)
+    return buf
+
+
+def _cluster_lines(positions: np.ndarray) -> List[int]:
+    """ מקבץ מיקומי מקטעי קווים (מערך חד-ממדי) לקווים בודדים על ידי מיצוע (וקטורי, NumPy) """
+    if len(positions) == 0:
         return []
-    sort_index = 1 if orientation == 'horizontal' else 0
-    lines.sort(key=lambda line: line[0][sort_index])
-    clustered_lines = []
-    current_cluster = [lines[0][0][sort_index]]
-    last_pos = lines[0][0][sort_index]
-    for line in lines[1:]:
-        pos = line[0][sort_index]
-        if abs(pos - last_pos) < 10:
-            current_cluster.append(pos)
-        else:
-            clustered_lines.append(int(np.mean(current_cluster)))
-            current_cluster = [pos]
-        last_pos = pos
-    if current_cluster:
-        clustered_lines.append(int(np.mean(current_cluster)))
-    return clustered_lines
+    pos = np.sort(positions.astype(np.int64, copy=False))
+    # גבולות האשכולות: היכן שהפער בין מיקומים עוקבים >= 10
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(pos) >= 10) + 1))
+    sums = np.add.reduceat(pos, starts)
+    counts = np.diff(np.append(starts, len(pos)))
+    return (sums // counts).tolist()
 
 
 # --- 💡 שינוי: פונקציית עזר V5 💡 ---
@@ -581,25 +721,34 @@ def _cluster_lines(lines: List[np.ndarray], orientation: str = 'horizontal') ->
 # 2. קרנל מורפולוגי הוגדל ל-(1, 80)
 def _find_graph_grid_internal(
     img: np.ndarray,
-    canny_thresholds: Tuple[int, int],
+    canny_thresholds: Optional[Tuple[int, int]],
     use_morphology: bool = False,
-    hough_params: Optional[Dict[str, int]] = None  # 💡 תוספת חדשה
+    hough_params: Optional[Dict[str, int]] = None,  # 💡 תוספת חדשה
+    gray: Optional[np.ndarray] = None,
+    morph_buf: Optional[np.ndarray] = None
 ) -> Dict[str, List[int]]:
     """
     פונקציית עזר פנימית לזיהוי רשת עם ערכי סף דינמיים,
     מורפולוגיה, ופרמטרי Hough דינמיים.
+    use_morphology: במקום Canny - סף אדפטיבי וסגירה אופקית על המסכה (canny_thresholds לא בשימוש).
+    gray: גרסת אפור מחושבת מראש של img (משותפת בין האסטרטגיות); אם לא סופקה - מחושבת כאן.
+    morph_buf: באפר יעד מוקצה מראש לתוצאת המורפולוגיה (בגודל gray).
     """
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if gray is None:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     h, w = gray.shape
     
-    # --- *** תוספת חדשה *** ---
+    # 1. מפת קצוות בינארית ל-Hough
     if use_morphology:
-        # 💡 שינוי: קרנל (גרעין) אופקי רחב יותר לחיבור מקטעים רחוקים
-        kernel = np.ones((1, 80), np.uint8)  # הועלה מ-30
-        gray = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-    
-    # 1. השתמש ב-Canny Edge Detection
-    edges = cv2.Canny(gray, canny_thresholds[0], canny_thresholds[1])
+        # סף אדפטיבי בשתי הקוטביות (קו בהיר על רקע כהה ולהפך): |gray - ממוצע מקומי| > delta,
+        # ואז סגירה אופקית על המסכה הבינארית - המסכה מוזנת ישירות ל-Hough, ללא Canny
+        local_diff = cv2.absdiff(gray, cv2.blur(gray, (_GRID_BINARY_BLOCK, _GRID_BINARY_BLOCK)))
+        _, binary = cv2.threshold(local_diff, _GRID_BINARY_DELTA, 255, cv2.THRESH_BINARY, dst=morph_buf)
+        # 💡 שינוי: קרנל (גרעין) אופקי רחב יותר לחיבור מקטעים רחוקים (הועלה מ-30 ל-80)
+        edges = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, _HORIZ_KERNEL_80x1, dst=binary)
+    else:
+        # השתמש ב-Canny Edge Detection
+        edges = cv2.Canny(gray, int(canny_thresholds[0]), int(canny_thresholds[1]), _edges_buffer(gray.shape))
     
     # 2. השתמש ב-Hough Line Transform
     # --- 💡 שינוי: הגדרת פרמטרים גמישים ---
@@ -624,20 +773,14 @@ def _find_graph_grid_internal(
     if lines is None:
         return {'horizontal': [], 'vertical': []}
     
-    horizontal_lines = []
-    vertical_lines = []
-    
-    # 3. סנן ומיין
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        if abs(y1 - y2) < 10:
-            horizontal_lines.append(line)
-        elif abs(x1 - x2) < 10:
-            vertical_lines.append(line)
+    # 3. סנן ומיין (וקטורי): אופקי אם |dy| < 10, אחרת אנכי אם |dx| < 10
+    segments = lines.reshape(-1, 4)
+    horizontal_mask = np.abs(segments[:, 3] - segments[:, 1]) < 10
+    vertical_mask = ~horizontal_mask & (np.abs(segments[:, 2] - segments[:, 0]) < 10)
     
-    # 4. קבץ
-    clustered_horizontal = _cluster_lines(horizontal_lines, 'horizontal')
-    clustered_vertical = _cluster_lines(vertical_lines, 'vertical')
+    # 4. קבץ (לפי y1 לקווים אופקיים ו-x1 לאנכיים)
+    clustered_horizontal = _cluster_lines(segments[horizontal_mask, 1])
+    clustered_vertical = _cluster_lines(segments[vertical_mask, 0])
     
     return {
         'horizontal': clustered_horizontal,
@@ -645,6 +788,117 @@ def _find_graph_grid_internal(
     }
 
 
+# פרמטרים לחיפוש אשכול קווים במרווחים קבועים (סדרה חשבונית)
+_GRID_MIN_SPACING = 25  # סובלני יותר
+_GRID_MAX_SPACING = 300
+_GRID_MAX_LINES_IN_CLUSTER = 9
+_GRID_DELTA_TOLERANCE = 6
+
+# תמונות גבוהות מזה מוקטנות פי 2 לפני זיהוי הרשת (מיקומי הקווים נשמרים בטווח הסובלנות)
+# ההקטנה (INTER_AREA) מחלישה את הניגודיות של קווים דקים, ולכן ספי ה-Canny של המעברים המוקטנים
+# מחולקים בפקטור; מעברי הניגודיות הנמוכה (full_res) רצים תמיד ברזולוציה המקורית
+_GRID_DOWNSCALE_MIN_HEIGHT = 1500
+_GRID_DOWNSCALE_FACTOR = 2
+
+# מעבר המורפולוגיה (Pass 4) עובד על סף אדפטיבי במקום Canny: גודל חלון הממוצע וההפרש המינימלי
+_GRID_BINARY_BLOCK = 15
+_GRID_BINARY_DELTA = 5
+
+# אסטרטגיות זיהוי הרשת, לפי סדר עדיפות. ב-Pass 4 אורך הקו המינימלי הוא רוחב/min_line_divisor
+_GRID_STRATEGIES = (
+    {'name': 'Pass 1: Standard', 'canny': (50, 150), 'morph': False, 'hough': None},
+    {'name': 'Pass 2: Sensitive', 'canny': (20, 60), 'morph': False, 'hough': None},
+    {'name': 'Pass 3: Dark Mode', 'canny': (5, 25), 'morph': False, 'hough': None, 'full_res': True},
+    {'name': 'Pass 4: Android/Dotted', 'canny': None, 'morph': True, 'hough': {'maxLineGap': 60},
+     'min_line_divisor': 20, 'full_res': True},
+)
+
+# סף "ביטחון גבוה": אשכול כזה באזור הבטוח עוצר את המעבר על שאר האסטרטגיות
+_GRID_CONFIDENT_SCORE = 50000
+_GRID_CONFIDENT_MIN_LINES = 5
+
+# מעבר המורפולוגיה מדולג כשהמעברים הקודמים מצאו לפחות כמה קווים (וגם אשכול ארוך)
+_GRID_SKIP_MORPH_MIN_LINES = 20
+
+
+def _best_line_cluster(lines_sorted: List[int], image_height: int, pass_name: str) -> Optional[Dict[str, Any]]:
+    """
+    מוצא את אשכול הקווים האופקיים הטוב ביותר (סדרה חשבונית) מתוך lines_sorted.
+    כל הזוגות (i, j) נבדקים במקביל ב-NumPy: לכל זוג האשכול "גדל" בצעדים של delta,
+    כשבכל צעד נבחר הקו הראשון (לפי הסדר) בטווח הסובלנות מהמיקום הצפוי.
+    מחזיר את מילון האשכול בעל הניקוד הגבוה ביותר, או None.
+    """
+    L = np.asarray(lines_sorted, dtype=np.int64)
+    n = len(L)
+    if n < 3:
+        return None
+    
+    # 1. כל הזוגות (i < j) עם נקודת התחלה בגבולות ומרווח חוקי - בסדר (i, j) לקסיקוגרפי
+    D = L[None, :] - L[:, None]
+    start_ok = (L > image_height * 0.10) & (L < image_height * 0.98)
+    pair_mask = start_ok[:, None] & (D > _GRID_MIN_SPACING) & (D < _GRID_MAX_SPACING)
+    I, J = np.nonzero(pair_mask)
+    if len(I) == 0:
+        return None
+    
+    # 2. הגדלת כל האשכולות במקביל. אשכולות של יותר מ-MAX_LINES נפסלים,
+    # לכן מספיק לבדוק עד אורך MAX_LINES + 1.
+    max_len = _GRID_MAX_LINES_IN_CLUSTER + 1
+    delta = D[I, J]
+    positions = np.zeros((len(I), max_len), dtype=np.int64)
+    positions[:, 0] = L[I]
+    positions[:, 1] = L[J]
+    lengths = np.full(len(I), 2, dtype=np.int64)
+    current = L[J].copy()
+    active = np.ones(len(I), dtype=bool)
+    
+    for step in range(2, max_len):
+        expected = current + delta
+        k = np.searchsorted(L, expected - _GRID_DELTA_TOLERANCE, side='right')
+        candidate = L[np.minimum(k, n - 1)]
+        active &= (k < n) & (candidate < expected + _GRID_DELTA_TOLERANCE)
+        if not active.any():
+            break
+        positions[active, step] = candidate[active]
+        current = np.where(active, candidate, current)
+        lengths += active
+    
+    valid = (lengths >= 3) & (lengths <= _GRID_MAX_LINES_IN_CLUSTER)
+    if not valid.any():
+        return None
+    
+    # 3. ניקוד: len^3 * 100 / (std(deltas) + 0.5), כפול מכפיל מיקום (V9)
+    std_dev = np.zeros(len(I), dtype=np.float64)
+    for length in np.unique(lengths[valid]):
+        rows = np.flatnonzero(valid & (lengths == length))
+        actual_deltas = np.ascontiguousarray(np.diff(positions[rows, :length], axis=1))
+        std_dev[rows] = np.std(actual_deltas, axis=1)
+    
+    base_score = (lengths ** 3 * 100) / (std_dev + 0.5)
+    
+    # --- 🛡️ V9: מיקום יחסי 🛡️ ---
+    cluster_bottom_relative = positions[np.arange(len(I)), lengths - 1] / image_height
+    location_multiplier = np.select(
+        [cluster_bottom_relative > 0.75, cluster_bottom_relative > 0.65],
+        [0.1, 0.8],  # 🛑 Kill Zone: Footer area (Bottom 25%) / ⚠️ Danger Zone: Lower third
+        default=1.2  # ✅ Safe Zone: Top/Center (Bonus)
+    )
+    final_score = np.where(valid, base_score * location_multiplier, -np.inf)
+    
+    # הראשון מבין בעלי הניקוד המקסימלי (כמו השוואה חזקה '>' בסדר (i, j))
+    best = int(np.argmax(final_score))
+    best_len = int(lengths[best])
+    current_cluster = positions[best, :best_len].tolist()
+    return {
+        'cluster': current_cluster,
+        'score': float(final_score[best]),
+        'type': f'{best_len}-line',
+        'pass_name': pass_name,
+        'location_multiplier': float(location_multiplier[best]),
+        'loc_debug': f"{cluster_bottom_relative[best]:.2f}"  # Debug info
+    }
+
+
 # --- 💡 שינוי: פונקציה מרכזית (ארכיטקטורה V9 - הטיית מיקום אגרסיבית) 💡 ---
 
 def find_graph_area(img: np.ndarray) -> Optional[Dict[str, Any]]:
@@ -654,35 +908,59 @@ def find_graph_area(img: np.ndarray) -> Optional[Dict[str, Any]]:
     2. Aggressive Penalty: העונש הוחמר מ-0.2 ל-0.1.
     3. Center/Top Boost: בונוס קטן לאשכולות בחלק העליון של המסך.
     """
-    print("--- Starting Graph Area Detection (V9: Aggressive Footer Filter) ---", file=sys.stderr)
-    image_height, image_width = img.shape[:2]
-    Y_MIN_BOUND = image_height * 0.10
-    Y_MAX_BOUND = image_height * 0.98
-    
-    strategies = [
-        {'name': 'Pass 1: Standard', 'canny': (50, 150), 'morph': False, 'hough': None},
-        {'name': 'Pass 2: Sensitive', 'canny': (20, 60), 'morph': False, 'hough': None},
-        {'name': 'Pass 3: Dark Mode', 'canny': (5, 25), 'morph': False, 'hough': None},
-        {'name': 'Pass 4: Android/Dotted', 'canny': (10, 30), 'morph': True, 'hough': {
-            'minLineLength': image_width // 20,
-            'maxLineGap': 60
-        }}
-    ]
+    logger.debug("--- Starting Graph Area Detection (V9: Aggressive Footer Filter) ---")
+    image_height = img.shape[0]
     
     all_passes_candidates = []
     all_lines_debug = set()
     all_vertical_debug = set()
     
-    MIN_SPACING = 25  # סובלני יותר
-    MAX_LINES_IN_CLUSTER = 9
+    # המרה לאפור פעם אחת, משותפת לכל האסטרטגיות (רק מעבר המורפולוגיה כותב - לבאפר נפרד)
+    gray_full = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    morph_buf = np.empty_like(gray_full)
+    
+    # מעברי הניגודיות הגבוהה רצים על תמונה מוקטנת (צילומי מסך גבוהים); המיקומים מוחזרים לקואורדינטות מקוריות
+    grid_scale = _GRID_DOWNSCALE_FACTOR if image_height > _GRID_DOWNSCALE_MIN_HEIGHT else 1
+    if grid_scale > 1:
+        gray_small = cv2.resize(gray_full, None, fx=1 / grid_scale, fy=1 / grid_scale, interpolation=cv2.INTER_AREA)
+    else:
+        gray_small = gray_full
+    
+    def strategy_scale(s):
+        return 1 if s.get('full_res') else grid_scale
     
-    for s in strategies:
-        grid_data = _find_graph_grid_internal(
+    def submit_strategy(s):
+        scale = strategy_scale(s)
+        gray = gray_full if scale == 1 else gray_small
+        canny = tuple(int(round(t / scale)) for t in s['canny']) if s['canny'] else None
+        return _GRID_POOL.submit(
+            _find_graph_grid_internal,
             img,
-            s['canny'],
+            canny,
             use_morphology=s['morph'],
-            hough_params=s['hough']
+            hough_params=dict(s['hough'], minLineLength=gray.shape[1] // s['min_line_divisor']) if s['hough'] else None,
+            gray=gray,
+            morph_buf=morph_buf
         )
+    
+    # הרצת האסטרטגיות במקביל; התוצאות נצרכות לפי סדר המעברים (הניקוד זול).
+    # מעבר המורפולוגיה (היקר ביותר) נשלח רק כשמגיעים אליו, כדי שאפשר יהיה לדלג עליו.
+    futures = [None if s['morph'] else submit_strategy(s) for s in _GRID_STRATEGIES]
+    
+    for pass_index, s in enumerate(_GRID_STRATEGIES):
+        future = futures[pass_index]
+        if future is None:
+            # דילוג על המורפולוגיה: המעברים הקודמים כבר מצאו הרבה קווים ואשכול ארוך
+            if (len(all_lines_debug) >= _GRID_SKIP_MORPH_MIN_LINES
+                    and any(len(c['cluster']) >= _GRID_CONFIDENT_MIN_LINES for c in all_passes_candidates)):
+                logger.debug("   > ⏭️ Enough lines from earlier passes - skipping %s", s['name'])
+                continue
+            future = futures[pass_index] = submit_strategy(s)
+        
+        grid_data = future.result()
+        scale = strategy_scale(s)
+        if scale > 1:
+            grid_data = {k: [p * scale for p in v] for k, v in grid_data.items()}
         
         lines_sorted = sorted(grid_data['horizontal'])
         all_lines_debug.update(lines_sorted)
@@ -691,71 +969,20 @@ def find_graph_area(img: np.ndarray) -> Optional[Dict[str, Any]]:
         if len(lines_sorted) < 3:
             continue
         
-        best_cluster_this_pass = None
-        best_score_this_pass = 0
-        DELTA_TOLERANCE = 6
-        
-        for i in range(len(lines_sorted)):
-            line_start = lines_sorted[i]
-            if not (Y_MIN_BOUND < line_start < Y_MAX_BOUND):
-                continue
-            
-            for j in range(i + 1, len(lines_sorted)):
-                line_next = lines_sorted[j]
-                delta = line_next - line_start
-                if not (MIN_SPACING < delta < 300):
-                    continue
-                
-                current_cluster = [line_start, line_next]
-                current_line = line_next
-                
-                for k in range(j + 1, len(lines_sorted)):
-                    next_line_candidate = lines_sorted[k]
-                    expected_line = current_line + delta
-                    if abs(next_line_candidate - expected_line) < DELTA_TOLERANCE:
-                        current_cluster.append(next_line_candidate)
-                        current_line = next_line_candidate
-                    elif next_line_candidate > expected_line + DELTA_TOLERANCE:
-                        break
-                
-                if len(current_cluster) >= 3:
-                    if len(current_cluster) > MAX_LINES_IN_CLUSTER:
-                        continue
-                    
-                    actual_deltas = np.diff(current_cluster)
-                    std_dev = np.std(actual_deltas)
-                    # Base Score
-                    base_score = (pow(len(current_cluster), 3) * 100) / (std_dev + 0.5)
-                    
-                    # --- 🛡️ V9: מיקום יחסי 🛡️ ---
-                    cluster_bottom_relative = current_cluster[-1] / image_height
-                    
-                    # ברירת מחדל
-                    location_multiplier = 1.0
-                    if cluster_bottom_relative > 0.75:
-                        # 🛑 Kill Zone: Footer area (Bottom 25%)
-                        location_multiplier = 0.1
-                    elif cluster_bottom_relative > 0.65:
-                        # ⚠️ Danger Zone: Lower third (Android graphs live here sometimes)
-                        location_multiplier = 0.8
-                    else:
-                        # ✅ Safe Zone: Top/Center (Bonus)
-                        location_multiplier = 1.2
-                    
-                    final_score = base_score * location_multiplier
-                    
-                    if final_score > best_score_this_pass:
-                        best_score_this_pass = final_score
-                        best_cluster_this_pass = {
-                            'cluster': current_cluster,
-                            'score': final_score,
-                            'type': f'{len(current_cluster)}-line',
-                            'pass_name': s['name'],
-                            'loc_debug': f"{cluster_bottom_relative:.2f}"  # Debug info
-                        }
+        best_cluster_this_pass = _best_line_cluster(lines_sorted, image_height, s['name'])
         
         if best_cluster_this_pass:
             all_passes_candidates.append(best_cluster_this_pass)
+            
+            # יציאה מוקדמת: אשכול ארוך, אחיד ובאזור הבטוח - אין טעם להריץ את המעברים היקרים הבאים
+            if (len(best_cluster_this_pass['cluster']) >= _GRID_CONFIDENT_MIN_LINES
+                    and best_cluster_this_pass['score'] > _GRID_CONFIDENT_SCORE
+                    and best_cluster_this_pass['location_multiplier'] == 1.2):
+                logger.debug("   > ⚡ High-confidence cluster in %s - skipping remaining passes", s['name'])
+                for pending in futures[pass_index + 1:]:
+                    if pending is not None:
+                        pending.cancel()
+                break
     
     # --- סיכום ---
     debug_grid_data = {
@@ -764,7 +991,7 @@ def find_graph_area(img: np.ndarray) -> Optional[Dict[str, Any]]:
     }
     
     if not all_passes_candidates:
-        print("\n   > ❌ FAILURE: All passes failed.", file=sys.stderr)
+        logger.warning("   > ❌ FAILURE: All passes failed.")
         return {
             'y_top': None,
             'y_bottom': None,
@@ -776,14 +1003,16 @@ def find_graph_area(img: np.ndarray) -> Optional[Dict[str, Any]]:
     best_candidate = max(all_passes_candidates, key=lambda x: x['score'])
     best_cluster = best_candidate['cluster']
     
-    y_top = min(best_cluster)
-    y_bottom = max(best_cluster)
-    avg_delta = np.median(np.diff(best_cluster))
+    # האשכול ממוין בסדר עולה - המרה אחת למערך int32 לחישוב המרווח החציוני
+    cluster_arr = np.asarray(best_cluster, dtype=np.int32)
+    y_top = best_cluster[0]
+    y_bottom = best_cluster[-1]
+    avg_delta = float(np.median(np.diff(cluster_arr)))
     
-    print(f"\n--- 🏆 WINNER: {best_candidate['pass_name']} ---", file=sys.stderr)
-    print(f"   > Lines: {len(best_cluster)}", file=sys.stderr)
-    print(f"   > Rel Position: {best_candidate['loc_debug']}", file=sys.stderr)
-    print(f"   > Score: {best_candidate['score']:.1f}", file=sys.stderr)
+    logger.debug(
+        "--- 🏆 WINNER: %s ---\n   > Lines: %d\n   > Rel Position: %s\n   > Score: %.1f",
+        best_candidate['pass_name'], len(best_cluster), best_candidate['loc_debug'], best_candidate['score']
+    )
     
     return {
         'y_top': y_top,
@@ -794,19 +1023,29 @@ def find_graph_area(img: np.ndarray) -> Optional[Dict[str, Any]]:
     }
 
 
-def calculate_minutes_for_day(image_path: str, target_day: str, google_api_key: str = None) -> Dict[str, Any]:
+def calculate_minutes_for_day(
+    image_input,
+    target_day: str,
+    google_api_key: str = None,
+    semantic_data: Optional[Dict[str, Any]] = None,
+    draw_debug: bool = False
+) -> Dict[str, Any]:
     """
     מחשב כמה דקות שימוש היו ביום ספציפי מתוך צילום מסך של גרף.
     הפונקציה חותכת את התמונה, מנתחת את הברים, ומנרמלת את הקואורדינטות
     של ראשי הברים בחזרה לתמונה המקורית לצורך חישוב מדויק.
+    image_input: נתיב לקובץ (str) או תמונה מפוענחת (numpy array, BGR).
+    semantic_data: פלט Gemini שכבר חולץ עבור אותה תמונה (למשל מ-cache) - אם סופק,
+    הקריאה ל-Gemini מדולגת. הפלט שבשימוש מוחזר תחת "semantic_data".
+    draw_debug: האם לבנות את תמונת הדיבוג ("debug_image"); כבוי כברירת מחדל.
     """
     # 1. טעינת התמונה
-    img = _load_image(image_path)
+    img = image_input if isinstance(image_input, np.ndarray) else _load_image(image_input)
     if img is None:
         return {"error": "Image could not be loaded"}
     
     image_height, image_width = img.shape[:2]
-    print(f"\n--- 🚀 Starting Analysis for Day: {target_day} ---", file=sys.stderr)
+    logger.debug("--- 🚀 Starting Analysis for Day: %s ---", target_day)
     
     # 2. זיהוי רשת הגרף (קואורדינטות מקוריות)
     grid_info = find_graph_area(img)
@@ -824,14 +1063,15 @@ def calculate_minutes_for_day(image_path: str, target_day: str, google_api_key:
     # יצירת התמונה החתוכה
     cropped_img = img[crop_top:crop_bottom, 0:image_width]
     
-    # 3. חילוץ סמנטי באמצעות Gemini (משתמש ב-cropped_img)
-    extractor = SinglePromptGraphExtractor(google_api_key)
-    semantic_data = extractor.extract_graph_data(cropped_img)
+    # 3. חילוץ סמנטי באמצעות Gemini (משתמש ב-cropped_img), אלא אם כבר סופק
+    if semantic_data is None:
+        extractor = _get_extractor(google_api_key or "")
+        semantic_data = extractor.extract_graph_data(cropped_img)
     
     # ניקוי והמרת הערך העליון
     try:
         raw_top_value = str(semantic_data.get('Y-axisTopValue', '0'))
-        clean_val = re.sub(r"[^\d\.]", "", raw_top_value)
+        clean_val = _NUM_RE.sub("", raw_top_value)
         max_value_minutes = float(clean_val) if clean_val else 0
     except ValueError:
         max_value_minutes = 0
@@ -840,65 +1080,51 @@ def calculate_minutes_for_day(image_path: str, target_day: str, google_api_key:
     pixel_span = zero_line_y - max_line_y
     scale_minutes_per_px = max_value_minutes / pixel_span if pixel_span > 0 and max_value_minutes > 0 else 0
     
-    print(f"⚖️ Scale Factor: {scale_minutes_per_px:.4f} minutes/pixel", file=sys.stderr)
+    logger.debug("⚖️ Scale Factor: %.4f minutes/pixel", scale_minutes_per_px)
     
     # 5. זיהוי פיזי של העמודות (משתמש ב-cropped_img)
-    detected_bars_cropped, debug_img_cropped = detect_bars_positions(cropped_img)
+    detected_bars_cropped, debug_img_cropped = detect_bars_positions(cropped_img, draw_debug=draw_debug)
     
     # מיון העמודות מימין-לשמאל (R-to-L)
     bars_rtl = sorted(detected_bars_cropped, key=lambda b: b['center_x'], reverse=True)
     
-    print(f"👀 Vision: Detected {len(bars_rtl)} bars (sorted Right-to-Left)", file=sys.stderr)
+    logger.debug("👀 Vision: Detected %d bars (sorted Right-to-Left)", len(bars_rtl))
     
-    # 6. מיפוי (Mapping) וחישוב
-    day_value_map = {}
+    # 6. מיפוי (Mapping) וחישוב - וקטורי: התווית ה-k עם עמודה מקבלת את העמודה ה-k (R-to-L)
     labels_rtl = semantic_data.get("X-axis", [])
-    bar_index = 0
+    has_bar = np.fromiter((bool(lo.get('has_bar')) for lo in labels_rtl), dtype=bool, count=len(labels_rtl))
+    bar_ids = np.cumsum(has_bar) - 1
+    matched = has_bar & (bar_ids < len(bars_rtl))
     
-    for label_obj in labels_rtl:
-        day_name = label_obj.get('label')
-        has_bar = label_obj.get('has_bar')
-        
-        calculated_minutes = 0.0
-        bar_pixel_height = 0
-        
-        if has_bar:
-            if bar_index < len(bars_rtl):
-                current_bar = bars_rtl[bar_index]
-                
-                # ה-y_top של הבר הוא בתוך התמונה החתוכה
-                bar_top_y_cropped = current_bar['y_top']
-                
-                # 💡 הנירמול: החזרת הקואורדינטה למערכת הייחוס המקורית!
-                bar_top_y_normalized = bar_top_y_cropped + crop_top
-                
-                # חישוב גובה העמודה בפיקסלים ביחס לקו האפס המקורי
-                # (zero_line_y הוא הקואורדינטה המקורית של קו האפס)
-                bar_pixel_height = zero_line_y - bar_top_y_normalized
-                
-                # המרה לדקות
-                calculated_minutes = bar_pixel_height * scale_minutes_per_px
-                
-                bar_index += 1
-            else:
-                print(f"⚠️ Mismatch: Label '{day_name}' expects a bar, but no more physical bars found.", file=sys.stderr)
-        
-        day_value_map[day_name] = {
-            "minutes": round(calculated_minutes, 1),
-            "pixels": bar_pixel_height
-        }
+    # ה-y_top של הבר הוא בתוך התמונה החתוכה - מנורמל חזרה למערכת הייחוס המקורית (+crop_top),
+    # והגובה בפיקסלים מחושב ביחס לקו האפס המקורי (zero_line_y)
+    bar_tops = np.fromiter((b['y_top'] for b in bars_rtl), dtype=np.int64, count=len(bars_rtl))
+    pixel_heights = np.zeros(len(labels_rtl), dtype=np.int64)
+    pixel_heights[matched] = zero_line_y - (bar_tops[bar_ids[matched]] + crop_top)
+    
+    # המרה לדקות
+    minutes = pixel_heights * scale_minutes_per_px
+    
+    for idx in np.flatnonzero(has_bar & ~matched):
+        logger.warning("⚠️ Mismatch: Label '%s' expects a bar, but no more physical bars found.", labels_rtl[idx].get('label'))
+    
+    day_value_map = {
+        label_obj.get('label'): {"minutes": round(float(m), 1), "pixels": int(px)}
+        for label_obj, m, px in zip(labels_rtl, minutes, pixel_heights)
+    }
     
     # 7. הצגת התוצאה עבור היום המבוקש (ללא שינוי)
     result_data = day_value_map.get(target_day)
     
     if result_data:
         final_minutes = result_data['minutes']
-        print(f"\n🎯 === RESULT for '{target_day}' ===", file=sys.stderr)
-        print(f"   Values: {final_minutes} minutes", file=sys.stderr)
-        print(f"   Calculation: {result_data['pixels']}px height * {scale_minutes_per_px:.4f} scale", file=sys.stderr)
+        logger.debug(
+            "🎯 === RESULT for '%s' ===\n   Values: %s minutes\n   Calculation: %spx height * %.4f scale",
+            target_day, final_minutes, result_data['pixels'], scale_minutes_per_px
+        )
     else:
         final_minutes = 0
-        print(f"\n❌ Day '{target_day}' not found in graph data.", file=sys.stderr)
+        logger.warning("❌ Day '%s' not found in graph data.", target_day)
     
     # 8. בניית תמונת דיבוג בגודל מלא (ללא שינוי)
     if debug_img_cropped is not None:
@@ -916,6 +1142,7 @@ def calculate_minutes_for_day(image_path: str, target_day: str, google_api_key:
         "pixels_height": result_data['pixels'] if result_data else 0,
         "scale_factor": scale_minutes_per_px,
         "full_map": day_value_map,
+        "semantic_data": semantic_data,
         "debug_image": final_debug_img
     }
 
@@ -925,6 +1152,9 @@ def calculate_minutes_for_day(image_path: str, target_day: str, google_api_key:
 # ==========================================
 
 class GraphTelemetryService:
+    # Max number of Gemini results kept in the per-service LRU cache
+    GEMINI_CACHE_SIZE = 128
+    
     def __init__(self, google_api_key: str):
         """
         Initialize the service with the API key.
@@ -938,63 +1168,108 @@ class GraphTelemetryService:
                 genai.configure(api_key=google_api_key)
                 self.model = genai.GenerativeModel('gemini-1.5-flash')
             except ImportError:
-                print("Warning: google.generativeai not available, using mock data", file=sys.stderr)
+                logger.warning("Warning: google.generativeai not available, using mock data")
                 self.use_mock = True
         else:
-            print("Using mock Gemini output (API key is empty)", file=sys.stderr)
+            logger.info("Using mock Gemini output (API key is empty)")
+        
+        # Compiled regex shared with calculate_minutes_for_day
+        self.num_pattern = _NUM_RE
         
-        # Compilation of Regex for speed
-        self.num_pattern = re.compile(r"[^\d\.]")
-        self.json_pattern = re.compile(r"\{.*\}", re.DOTALL)
+        # LRU cache of Gemini results keyed by image hash (shared across request threads)
+        self._gemini_cache = OrderedDict()
+        self._gemini_cache_lock = threading.Lock()
     
-    def process_day(self, image_input, target_day: str) -> Dict[str, Any]:
+    def _calculate(self, image_input, target_day: str, cache_key: Optional[bytes]) -> Dict[str, Any]:
+        """
+        Run calculate_minutes_for_day, reusing a cached Gemini result for cache_key if present.
+        Only successful extractions (non-empty X-axis) are cached.
+        """
+        semantic_data = None
+        if cache_key is not None:
+            with self._gemini_cache_lock:
+                semantic_data = self._gemini_cache.get(cache_key)
+                if semantic_data is not None:
+                    self._gemini_cache.move_to_end(cache_key)
+        
+        result = calculate_minutes_for_day(image_input, target_day, self.google_api_key, semantic_data=semantic_data)
+        
+        extracted = result.get("semantic_data")
+        if cache_key is not None and semantic_data is None and extracted and extracted.get("X-axis"):
+            with self._gemini_cache_lock:
+                self._gemini_cache[cache_key] = extracted
+                self._gemini_cache.move_to_end(cache_key)
+                while len(self._gemini_cache) > self.GEMINI_CACHE_SIZE:
+                    self._gemini_cache.popitem(last=False)
+        return result
+    
+    def process_day(self, image_input, target_day: str, cache_key: Optional[bytes] = None) -> Dict[str, Any]:
         """
         Main entry point.
         image_input: Can be a file path (str) or numpy array.
+        cache_key: Optional image identity (e.g. SHA-256 of the uploaded bytes);
+                   repeats of the same key reuse the cached Gemini result.
         """
-        # Convert numpy array to file path if needed
-        if isinstance(image_input, np.ndarray):
-            # For numpy arrays, we'll process directly
-            # Save to temp file or process in memory
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                cv2.imwrite(tmp_file.name, image_input)
-                temp_path = tmp_file.name
-            try:
-                result = calculate_minutes_for_day(temp_path, target_day, self.google_api_key)
-            finally:
-                os.unlink(temp_path)
-            return result
-        elif isinstance(image_input, str):
-            result = calculate_minutes_for_day(image_input, target_day, self.google_api_key)
-            # Convert to old format for compatibility
-            return {
-                "day": result.get("target_day", target_day),
-                "minutes": result.get("minutes", 0),
-                "found": result.get("minutes", 0) > 0 or target_day in result.get("full_map", {}),
-                "metadata": {
-                    "scale_min_per_px": result.get("scale_factor", 0),
-                    "max_val_y": result.get("raw_max_value", 0)
-                }
-            }
-        else:
+        if not isinstance(image_input, (np.ndarray, str)):
             return {"error": "Invalid image input"}
+        
+        # numpy arrays are processed in memory - no temp file round-trip
+        result = self._calculate(image_input, target_day, cache_key)
+        return self._to_compat_result(result, target_day)
+    
+    def process_day_multi(self, image_input, target_days: List[str], cache_key: Optional[bytes] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Process several days from the same screenshot.
+        Grid/bar detection and the Gemini call run once; each day is then
+        looked up in the resulting full_map.
+        Returns {day: <process_day-style result>}.
+        """
+        if not isinstance(image_input, (np.ndarray, str)):
+            return {day: {"error": "Invalid image input"} for day in target_days}
+        if not target_days:
+            return {}
+        
+        result = self._calculate(image_input, target_days[0], cache_key)
+        full_map = result.get("full_map", {})
+        
+        day_results = {}
+        for day in target_days:
+            day_data = full_map.get(day)
+            day_result = dict(result, target_day=day, minutes=day_data["minutes"] if day_data else 0)
+            day_results[day] = self._to_compat_result(day_result, day)
+        return day_results
+    
+    @staticmethod
+    def _to_compat_result(result: Dict[str, Any], target_day: str) -> Dict[str, Any]:
+        """Convert a calculate_minutes_for_day result to the old format for compatibility."""
+        return {
+            "day": result.get("target_day", target_day),
+            "minutes": result.get("minutes", 0),
+            "found": result.get("minutes", 0) > 0 or target_day in result.get("full_map", {}),
+            "metadata": {
+                "scale_min_per_px": result.get("scale_factor", 0),
+                "max_val_y": result.get("raw_max_value", 0)
+            }
+        }
 
 
 # ==========================================
 # Helper function to load .env.local
 # ==========================================
 
+# שורת KEY=VALUE שאינה הערה (שורות ריקות/הערות פשוט לא מתאימות)
+_ENV_LINE_RE = re.compile(r'^\s*([^#=\s][^=]*)=(.*)$')
+
+
+@lru_cache(maxsize=1)
 def _load_env_local() -> Dict[str, str]:
     """
-    מחפש וקורא את קובץ .env.local מהתיקייה הראשית של הפרויקט.
-    מחפש במיקומים הבאים:
+    מחפש וקורא את קובץ .env.local מהתיקייה הראשית של הפרויקט (התוצאה נשמרת ב-cache).
+    מחפש במיקומים הבאים, ומשתמש בראשון שנקרא בהצלחה:
     1. תיקיית הפרויקט (2 רמות מעלה מ-services/graph-telemetry)
     2. תיקיית services/graph-telemetry
     3. תיקייה נוכחית
     """
-    env_vars = {}
-    
     # מצא את התיקייה הראשית של הפרויקט
     current_file = Path(__file__).resolve()
     project_root = current_file.parent.parent.parent  # services/graph-telemetry -> services -> project root
@@ -1007,26 +1282,24 @@ def _load_env_local() -> Dict[str, str]:
     ]
     
     for env_path in search_paths:
-        if env_path.exists() and env_path.is_file():
-            try:
-                print(f"📁 Loading .env.local from: {env_path}", file=sys.stderr)
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        # דלג על שורות ריקות והערות
-                        if not line or line.startswith('#'):
-                            continue
-                        # פרסר KEY=VALUE
-                        if '=' in line:
-                            key, value = line.split('=', 1)
-                            key = key.strip()
-                            value = value.strip().strip('"').strip("'")
-                            env_vars[key] = value
-                print(f"✅ Loaded {len(env_vars)} variables from .env.local", file=sys.stderr)
-                break
-            except Exception as e:
-                print(f"⚠️ Warning: Could not read .env.local from {env_path}: {e}", file=sys.stderr)
+        if not env_path.is_file():
+            continue
+        try:
+            logger.debug("📁 Loading .env.local from: %s", env_path)
+            text = env_path.read_text(encoding='utf-8')
+            break
+        except Exception as e:
+            # קובץ שלא ניתן לקרוא - ממשיכים למיקום הבא
+            logger.warning("⚠️ Warning: Could not read .env.local from %s: %s", env_path, e)
+    else:
+        return {}
     
+    env_vars = {
+        m[1].strip(): m[2].strip().strip('"').strip("'")
+        for line in text.splitlines()
+        if (m := _ENV_LINE_RE.match(line))
+    }
+    logger.debug("✅ Loaded %d variables from .env.local", len(env_vars))
     return env_vars
 
 
@@ -1052,6 +1325,11 @@ if __name__ == "__main__":
     
     args = parser.parse_args()
     
+    # ב-CLI כל הודעות האבחון של המודול (כולל DEBUG) נכתבות ל-stderr, כמו קודם;
+    # הרמה מוגדרת על ה-logger של המודול בלבד, כדי לא להפעיל DEBUG בספריות (google/grpc/urllib3)
+    logging.basicConfig(stream=sys.stderr, format='%(message)s')
+    logger.setLevel(logging.DEBUG)
+    
     # Load .env.local first
     env_local = _load_env_local()
     
@@ -1064,9 +1342,16 @@ if __name__ == "__main__":
     # Output JSON to stdout with UTF-8 encoding
     # Always write to stdout buffer to avoid Windows encoding issues
     try:
-        json_output = json.dumps(result, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            # orjson encodes straight to UTF-8 bytes (and handles numpy values natively)
+            json_bytes = orjson.dumps(
+                result,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
+        else:
+            json_bytes = json.dumps(result, indent=2, ensure_ascii=False).encode('utf-8')
         # Write directly to stdout buffer with UTF-8 encoding (bypasses console encoding)
-        sys.stdout.buffer.write(json_output.encode('utf-8'))
+        sys.stdout.buffer.write(json_bytes)
         sys.stdout.buffer.write(b'\n')
         sys.stdout.buffer.flush()
     except (UnicodeEncodeError, AttributeError, OSError) as e: